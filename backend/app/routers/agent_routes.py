@@ -2,10 +2,12 @@
 import os, uuid
 from fastapi import APIRouter, UploadFile, File, Form
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from app.agent import get_workflow  # if you use workflow; otherwise call call_llm_structured directly
 from app.tools.ocr import ocr_image
-from app.tools.stt import transcribe_audio
+from app.tools.stt import transcribe_audio, get_stt_scheduler
 from app.tools.onenote import write_summary_to_onenote, get_notebook_section_map
+from app.tools.dedup import get_dedup_index, signature
 from app.agent import call_llm_structured  # function we added above
 
 router = APIRouter()
@@ -38,7 +40,8 @@ async def chat_endpoint(
             if used_mode == "image":
                 input_text = ocr_image(tmp_path)
             elif used_mode == "audio":
-                input_text = transcribe_audio(tmp_path)
+                # off the event loop so concurrent uploads can share an STT micro-batch
+                input_text = await run_in_threadpool(transcribe_audio, tmp_path)
             else:
                 # default fallback: treat as text artifact if possible
                 input_text = file.filename
@@ -54,6 +57,18 @@ async def chat_endpoint(
         if not input_text:
             return JSONResponse({"error": "No input provided"}, status_code=400)
 
+        # Near-duplicate check: re-exports / cropped copies reuse the earlier summary and route
+        dedup = get_dedup_index()
+        dedup_scope = f"{target_notebook}/{target_section}" if target_notebook and target_section else ""
+        dedup_sig = None
+        if dedup is not None:
+            # hashing a long transcript is CPU-bound; keep it off the event loop
+            dedup_sig = await run_in_threadpool(signature, input_text)
+            previous = dedup.lookup(dedup_sig, scope=dedup_scope)
+            if previous:
+                previous["duplicate"] = True
+                return previous
+
         # If user provided explicit target notebook/section, bypass LLM routing and use them.
         if target_notebook and target_section:
             # Summarize only, then write with user-specified route
@@ -63,7 +78,10 @@ async def chat_endpoint(
             llm = get_llm()
             summary = llm.invoke(llm_prompt)
             write_summary_to_onenote(summary, notebook=target_notebook, section=target_section)
-            return {"summary": summary, "notebook": target_notebook, "section": target_section}
+            result = {"summary": summary, "notebook": target_notebook, "section": target_section}
+            if dedup is not None:
+                dedup.add(dedup_sig, result, scope=dedup_scope)
+            return result
 
         # Normal flow: ask LLM to summarize and pick notebook/section from real inventory
         llm_structured = call_llm_structured(input_text)
@@ -96,15 +114,18 @@ async def chat_endpoint(
             else:
                 nb_choice, sec_choice = None, None
 
-        # write to OneNote if possible
-        if nb_choice and sec_choice:
-            write_summary_to_onenote(llm_structured.summary_md, notebook=nb_choice, section=sec_choice)
         # respond with structured output
-        return {
+        result = {
             "summary_md": llm_structured.summary_md,
             "route": {"notebook": nb_choice, "section": sec_choice},
             "raw_llm": llm_structured.raw,
         }
+        # write to OneNote if possible; only remember inputs that actually produced a page
+        if nb_choice and sec_choice:
+            write_summary_to_onenote(llm_structured.summary_md, notebook=nb_choice, section=sec_choice)
+            if dedup is not None:
+                dedup.add(dedup_sig, result, scope=dedup_scope)
+        return result
 
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -124,3 +145,8 @@ async def get_notebooks():
         return notebooks
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
+
+@router.get("/stt/stats")
+async def get_stt_stats():
+    """STT scheduler throughput and queueing latency"""
+    return get_stt_scheduler().stats()
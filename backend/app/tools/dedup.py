@@ -0,0 +1,142 @@
+"""
+Near-duplicate index for extracted text (OCR / STT / typed).
+
+Re-exported recordings and cropped screenshots produce text that is almost,
+but not exactly, the same. We keep a MinHash signature over word shingles for
+each processed input and treat anything scoring at least DEDUP_MIN_SIMILARITY,
+seen within DEDUP_WINDOW_SECONDS, as a repeat: the stored response is returned
+instead of calling the LLM and writing another OneNote page.
+
+The score is the larger of estimated Jaccard similarity and the containment of
+the new input in a stored one, so a cropped copy (a subset of the original
+text) still matches. Containment is one-directional and only trusted when the
+new input is between MIN_CONTAINMENT_RATIO and 1x the stored size: a long
+recording that merely includes an earlier snippet is not a duplicate, and the
+MinHash estimate is too noisy across very different sizes.
+
+Settings (env):
+- DEDUP_ENABLED (default true)
+- DEDUP_MIN_SIMILARITY (default 0.8)
+- DEDUP_WINDOW_SECONDS (default 86400)
+- DEDUP_MAX_ENTRIES (default 256, oldest evicted first)
+"""
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+NUM_PERM = 64
+SHINGLE_SIZE = 3
+# A crop must keep at least this share of the stored text's shingles for containment to count
+MIN_CONTAINMENT_RATIO = 0.5
+_PRIME = (1 << 61) - 1
+# Fixed seed so signatures stay comparable across restarts
+_rng = random.Random(1617)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+def _truthy(val: str | None) -> bool:
+    return str(val).lower() in {"1", "true", "yes", "on"}
+
+def _shingles(text: str) -> set[str]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return set(words)
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+# (MinHash values, number of shingles)
+Signature = tuple[tuple[int, ...], int]
+
+def signature(text: str) -> Optional[Signature]:
+    """MinHash signature over word shingles plus the shingle count; None if the text has no words."""
+    shingles = _shingles(text)
+    if not shingles:
+        return None
+    hashes = [int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big") for sh in shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS), len(shingles)
+
+def similarity(new: Signature, stored: Signature) -> float:
+    """Max of estimated Jaccard similarity and containment of `new` in `stored`.
+
+    Not symmetric: containment only counts when `new` is the smaller side and
+    at least MIN_CONTAINMENT_RATIO of the stored size.
+    """
+    (hash_new, size_new), (hash_stored, size_stored) = new, stored
+    j = sum(1 for x, y in zip(hash_new, hash_stored) if x == y) / NUM_PERM
+    if not MIN_CONTAINMENT_RATIO <= size_new / size_stored <= 1:
+        return j
+    # |A∩B| = J*(|A|+|B|)/(1+J); containment divides that by the new set
+    containment = j * (size_new + size_stored) / ((1 + j) * size_new)
+    return max(j, min(containment, 1.0))
+
+class NearDuplicateIndex:
+    """Bounded, time-windowed MinHash index mapping text signatures to stored responses."""
+
+    def __init__(self, min_similarity: float = 0.8, window_seconds: float = 86400, max_entries: int = 256):
+        self.min_similarity = min_similarity
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        # id -> (signature, scope, created_at, response)
+        self._entries: "OrderedDict[int, tuple[Signature, str, float, Dict[str, Any]]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        # entries are insertion-ordered, so stop at the first one still inside the window
+        while self._entries:
+            key, (_, _, created, _) = next(iter(self._entries.items()))
+            if now - created <= self.window_seconds:
+                break
+            self._entries.pop(key)
+
+    def lookup(self, sig: Optional[Signature], scope: str = "") -> Optional[Dict[str, Any]]:
+        """Return the stored response of the closest match within the window, if any.
+
+        `sig` comes from `signature()`, computed once per input and reused for `add`.
+        `scope` separates inputs that must not share results (e.g. explicit target overrides).
+        """
+        if sig is None:
+            return None
+        with self._lock:
+            self._expire(time.time())
+            best, best_sim = None, self.min_similarity
+            for other, other_scope, _, response in self._entries.values():
+                if other_scope != scope:
+                    continue
+                sim = similarity(sig, other)
+                if sim >= best_sim:
+                    best, best_sim = response, sim
+            return dict(best) if best is not None else None
+
+    def add(self, sig: Optional[Signature], response: Dict[str, Any], scope: str = "") -> None:
+        if sig is None:
+            return
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            self._entries[self._next_id] = (sig, scope, now, dict(response))
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Simple singleton-ish index
+_index: NearDuplicateIndex | None = None
+
+def get_dedup_index() -> Optional[NearDuplicateIndex]:
+    """Return the shared index, or None when DEDUP_ENABLED is off."""
+    global _index
+    if not _truthy(os.getenv("DEDUP_ENABLED", "true")):
+        return None
+    if _index is None:
+        _index = NearDuplicateIndex(
+            min_similarity=float(os.getenv("DEDUP_MIN_SIMILARITY", "0.8")),
+            window_seconds=float(os.getenv("DEDUP_WINDOW_SECONDS", "86400")),
+            max_entries=int(os.getenv("DEDUP_MAX_ENTRIES", "256")),
+        )
+    return _index
@@ -1,13 +1,291 @@
-from faster_whisper import WhisperModel
+"""
+Cross-request batched STT.
+
+Callers decode + VAD-split their own audio into <=30s speech chunks, then hand
+the chunks to a single scheduler thread. The scheduler gathers chunks from
+concurrent requests into one micro-batch (at most STT_BATCH_SIZE chunks, waiting
+at most STT_MAX_WAIT_MS after the first arrives) and runs them through
+faster-whisper's BatchedInferencePipeline in one call.
+
+Each chunk is padded to a full window and laid out back to back, so every clip
+maps to exactly one decoder slot and segments can be routed back by position.
+If a batch fails, its chunks are retried per request so only the bad request fails.
+
+Settings (env):
+- STT_MODEL (default "medium")
+- STT_BATCH_SIZE (default 8 chunks per micro-batch)
+- STT_MAX_WAIT_MS (default 50)
+- STT_LANGUAGE (optional; unset = per-chunk language detection)
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
 import torch
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
+from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps
+
+logger = logging.getLogger(__name__)
 
 # Check for CUDA availability and fallback to CPU
 device = "cuda" if torch.cuda.is_available() else "cpu"
 compute_type = "float16" if device == "cuda" else "int8"
 
-model = WhisperModel("medium", device=device, compute_type=compute_type)
+model = WhisperModel(os.getenv("STT_MODEL", "medium"), device=device, compute_type=compute_type)
+pipeline = BatchedInferencePipeline(model=model)
+
+SAMPLING_RATE = model.feature_extractor.sampling_rate
+CHUNK_LENGTH = model.feature_extractor.chunk_length  # seconds per decoder window
+BATCH_SIZE = int(os.getenv("STT_BATCH_SIZE", "8"))
+MAX_WAIT_S = float(os.getenv("STT_MAX_WAIT_MS", "50")) / 1000
+LANGUAGE = os.getenv("STT_LANGUAGE") or None
+
+
+def _split_speech(file_path: str) -> list[np.ndarray]:
+    """Decode a file and merge its VAD speech regions into chunks of at most CHUNK_LENGTH seconds."""
+    audio = decode_audio(file_path, sampling_rate=SAMPLING_RATE)
+    clips = get_speech_timestamps(
+        audio, VadOptions(max_speech_duration_s=CHUNK_LENGTH, min_silence_duration_ms=160)
+    )
+    if not clips:
+        return []
+    chunks, _ = collect_chunks(audio, clips, sampling_rate=SAMPLING_RATE, max_duration=CHUNK_LENGTH)
+    return [c for c in chunks if c.size]
+
+
+class _Job:
+    """One caller's chunks; the future resolves once every chunk has been transcribed."""
+
+    def __init__(self, chunks: list[np.ndarray]):
+        self.chunks = chunks
+        self.texts: list[str | None] = [None] * len(chunks)
+        self.remaining = len(chunks)
+        self.next_chunk = 0
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+        self.first_dispatched_at: float | None = None
+        # wall time of the batches this job's chunks were in
+        self.inference_s = 0.0
+
+
+class STTScheduler:
+    """Collects speech chunks from concurrent requests into micro-batches for one shared model.
+
+    Batches are filled one chunk at a time, round-robin across pending jobs, so a
+    long upload is spread over several batches and interleaves with short ones
+    instead of blocking them.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, max_wait_s: float = MAX_WAIT_S):
+        self.batch_size = max(1, batch_size)
+        self.max_wait_s = max_wait_s
+        # jobs with chunks not yet handed to a batch, in round-robin order
+        self._pending: "deque[_Job]" = deque()
+        self._cond = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "failed_batches": 0,
+            "requests": 0,
+            "chunks": 0,
+            "audio_seconds": 0.0,
+            "inference_seconds": 0.0,
+            # submit -> first chunk dispatched, per request
+            "queue_wait_seconds": 0.0,
+            "max_queue_wait_seconds": 0.0,
+            # time a batch was held open waiting for more chunks
+            "batch_hold_seconds": 0.0,
+            # end-to-end latency minus the request's own batch time, per request
+            "added_latency_seconds": 0.0,
+            "max_added_latency_seconds": 0.0,
+        }
+        self._worker = threading.Thread(target=self._run, name="stt-scheduler", daemon=True)
+        self._worker.start()
+
+    def is_alive(self) -> bool:
+        return self._worker.is_alive()
+
+    def submit(self, chunks: list[np.ndarray]) -> Future:
+        job = _Job(chunks)
+        with self._cond:
+            self._pending.append(job)
+            self._cond.notify()
+        return job.future
+
+    def wait(self, future: Future, poll_s: float = 1.0) -> str:
+        """Block for a result, failing instead of hanging if the worker thread has died."""
+        while True:
+            try:
+                return future.result(timeout=poll_s)
+            except FutureTimeoutError:
+                if not self.is_alive():
+                    raise RuntimeError("STT scheduler stopped")
+
+    def _collect(self) -> tuple[list[tuple[_Job, int]], float]:
+        """Take up to batch_size (job, chunk index) items, waiting at most max_wait_s after the first.
+
+        Also returns when the first item became available, to measure the batching hold.
+        """
+        items: list[tuple[_Job, int]] = []
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            opened = time.perf_counter()
+            deadline = opened + self.max_wait_s
+            while len(items) < self.batch_size:
+                if not self._pending:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0 or not self._cond.wait(timeout=remaining):
+                        break
+                    continue
+                job = self._pending.popleft()
+                # drop leftover chunks of a job that already failed
+                if job.future.done():
+                    continue
+                items.append((job, job.next_chunk))
+                job.next_chunk += 1
+                if job.next_chunk < len(job.chunks):
+                    self._pending.append(job)
+        return items, opened
+
+    def _run(self) -> None:
+        while True:
+            items: list[tuple[_Job, int]] = []
+            try:
+                items, opened = self._collect()
+                if not items:
+                    continue
+                started = time.perf_counter()
+                jobs = list(dict.fromkeys(job for job, _ in items))
+                for job in jobs:
+                    if job.first_dispatched_at is None:
+                        job.first_dispatched_at = started
+
+                failed = False
+                try:
+                    results = list(zip(items, self._transcribe_batch([job.chunks[i] for job, i in items])))
+                except Exception:
+                    # don't let one bad request fail everyone it was batched with: retry per job
+                    logger.exception("STT batch failed, retrying per request")
+                    failed = True
+                    results = []
+                    for job in jobs:
+                        job_items = [item for item in items if item[0] is job]
+                        try:
+                            texts = self._transcribe_batch([job.chunks[i] for _, i in job_items])
+                        except Exception as e:
+                            logger.exception("STT request failed")
+                            if not job.future.done():
+                                job.future.set_exception(e)
+                            continue
+                        results.extend(zip(job_items, texts))
+                elapsed = time.perf_counter() - started
+
+                finished: list[_Job] = []
+                for job in jobs:
+                    job.inference_s += elapsed
+                for (job, i), text in results:
+                    job.texts[i] = text
+                    job.remaining -= 1
+                    if job.remaining == 0 and not job.future.done():
+                        job.future.set_result(" ".join(t for t in job.texts if t).strip())
+                        finished.append(job)
+                self._record(items, elapsed, started - opened, finished, failed)
+            except Exception as e:
+                logger.exception("STT scheduler error")
+                for job, _ in items:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+
+    def _transcribe_batch(self, chunks: list[np.ndarray]) -> list[str]:
+        if not chunks:
+            return []
+        window = CHUNK_LENGTH * SAMPLING_RATE
+
+        # Pad every chunk to a full window: clips of exactly CHUNK_LENGTH seconds are never
+        # merged by the pipeline, so clip k is decoded alone and covers [k*CHUNK_LENGTH, (k+1)*CHUNK_LENGTH).
+        audio = np.zeros(len(chunks) * window, dtype=np.float32)
+        for k, chunk in enumerate(chunks):
+            n = min(chunk.size, window)
+            audio[k * window:k * window + n] = chunk[:n]
+        clip_timestamps = [
+            {"start": k * CHUNK_LENGTH, "end": (k + 1) * CHUNK_LENGTH} for k in range(len(chunks))
+        ]
+
+        segments, _ = pipeline.transcribe(
+            audio,
+            language=LANGUAGE,
+            multilingual=LANGUAGE is None,  # requests may not share a language
+            clip_timestamps=clip_timestamps,
+            batch_size=self.batch_size,
+        )
+
+        parts: list[list[str]] = [[] for _ in chunks]
+        for seg in segments:
+            k = min(int((seg.start + seg.end) / 2 // CHUNK_LENGTH), len(chunks) - 1)
+            parts[k].append(seg.text)
+        return [" ".join(p).strip() for p in parts]
+
+    def _record(
+        self, items: list[tuple[_Job, int]], elapsed: float, hold: float, finished: list[_Job], failed: bool
+    ) -> None:
+        now = time.perf_counter()
+        waits = [job.first_dispatched_at - job.enqueued_at for job in finished]
+        added = [(now - job.enqueued_at) - job.inference_s for job in finished]
+        audio_s = sum(job.chunks[i].size for job, i in items) / SAMPLING_RATE
+        with self._stats_lock:
+            s = self._stats
+            s["batches"] += 1
+            s["failed_batches"] += int(failed)
+            s["requests"] += len(finished)
+            s["chunks"] += len(items)
+            s["audio_seconds"] += audio_s
+            s["inference_seconds"] += elapsed
+            s["batch_hold_seconds"] += hold
+            s["queue_wait_seconds"] += sum(waits)
+            s["max_queue_wait_seconds"] = max([s["max_queue_wait_seconds"], *waits])
+            s["added_latency_seconds"] += sum(added)
+            s["max_added_latency_seconds"] = max([s["max_added_latency_seconds"], *added])
+        logger.info(
+            "STT batch: %d chunks, %.1fs audio in %.2fs (%.1fx realtime), held %.0fms, %d requests completed",
+            len(items), audio_s, elapsed, audio_s / elapsed if elapsed else 0.0, hold * 1000, len(finished),
+        )
+
+    def stats(self) -> dict:
+        """Throughput and added queueing latency since startup."""
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["avg_batch_chunks"] = s["chunks"] / s["batches"] if s["batches"] else 0.0
+        s["realtime_factor"] = s["audio_seconds"] / s["inference_seconds"] if s["inference_seconds"] else 0.0
+        s["avg_batch_hold_seconds"] = s["batch_hold_seconds"] / s["batches"] if s["batches"] else 0.0
+        s["avg_queue_wait_seconds"] = s["queue_wait_seconds"] / s["requests"] if s["requests"] else 0.0
+        s["avg_added_latency_seconds"] = s["added_latency_seconds"] / s["requests"] if s["requests"] else 0.0
+        with self._cond:
+            s["pending_chunks"] = sum(len(job.chunks) - job.next_chunk for job in self._pending)
+        s["alive"] = self.is_alive()
+        return s
+
+
+# Simple singleton-ish scheduler
+_scheduler: STTScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+def get_stt_scheduler() -> STTScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        # replace a dead worker so later requests recover instead of queueing into nothing
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = STTScheduler()
+    return _scheduler
 
 def transcribe_audio(file_path: str):
-    segments, info = model.transcribe(file_path)
-    transcription = " ".join([seg.text for seg in segments])
-    return transcription
+    chunks = _split_speech(file_path)
+    if not chunks:
+        return ""
+    scheduler = get_stt_scheduler()
+    return scheduler.wait(scheduler.submit(chunks))
@@ -0,0 +1,99 @@
+import random
+
+from app.tools import dedup
+from app.tools.dedup import NearDuplicateIndex, signature, similarity
+
+
+def _words(n: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    return [f"w{rng.randrange(5000)}" for _ in range(n)]
+
+
+def _text(words: list[str]) -> str:
+    return " ".join(words)
+
+
+def test_signature_empty_text():
+    assert signature("") is None
+    assert signature("  ...  ") is None
+
+
+def test_near_match():
+    words = _words(300, seed=1)
+    edited = words[:150] + ["extra", "words"] + words[150:]
+    assert similarity(signature(_text(edited)), signature(_text(words))) >= 0.8
+
+
+def test_crop_matches_original():
+    words = _words(300, seed=2)
+    cropped = words[:200]
+    assert similarity(signature(_text(cropped)), signature(_text(words))) >= 0.8
+
+
+def test_unrelated_text():
+    a, b = _text(_words(300, seed=3)), _text(_words(300, seed=4))
+    assert similarity(signature(a), signature(b)) < 0.2
+
+
+def test_long_superset_does_not_match_stored_snippet():
+    for seed in range(50):
+        snippet = _words(25, seed=seed)
+        recording = _words(1500, seed=seed + 1000) + snippet + _words(1500, seed=seed + 2000)
+        assert similarity(signature(_text(recording)), signature(_text(snippet))) < 0.8
+
+
+def test_short_note_does_not_match_unrelated_long_transcript():
+    for seed in range(50):
+        transcript = _words(2000, seed=seed)
+        # shares two three-word phrases with the transcript
+        note = _words(16, seed=seed + 1000) + transcript[100:103] + transcript[900:903]
+        assert similarity(signature(_text(note)), signature(_text(transcript))) < 0.8
+
+
+def test_index_returns_stored_response_for_near_duplicate():
+    index = NearDuplicateIndex()
+    words = _words(300, seed=5)
+    index.add(signature(_text(words)), {"summary_md": "s"})
+    assert index.lookup(signature(_text(words[:250]))) == {"summary_md": "s"}
+    assert index.lookup(signature(_text(_words(300, seed=6)))) is None
+
+
+def test_index_scope_separation():
+    index = NearDuplicateIndex()
+    sig = signature(_text(_words(100, seed=7)))
+    index.add(sig, {"notebook": "Work"}, scope="Work/Meetings")
+    assert index.lookup(sig) is None
+    assert index.lookup(sig, scope="Personal/Tasks") is None
+    assert index.lookup(sig, scope="Work/Meetings") == {"notebook": "Work"}
+
+
+def test_index_window_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dedup.time, "time", lambda: now[0])
+    index = NearDuplicateIndex(window_seconds=60)
+    sig = signature(_text(_words(100, seed=8)))
+    index.add(sig, {"summary_md": "s"})
+    now[0] += 59
+    assert index.lookup(sig) is not None
+    now[0] += 2
+    assert index.lookup(sig) is None
+    assert len(index) == 0
+
+
+def test_index_max_entries_evicts_oldest():
+    index = NearDuplicateIndex(max_entries=3)
+    sigs = [signature(_text(_words(100, seed=10 + i))) for i in range(5)]
+    for i, sig in enumerate(sigs):
+        index.add(sig, {"i": i})
+    assert len(index) == 3
+    assert index.lookup(sigs[0]) is None
+    assert index.lookup(sigs[1]) is None
+    assert index.lookup(sigs[4]) == {"i": 4}
+
+
+def test_index_lookup_returns_copy():
+    index = NearDuplicateIndex()
+    sig = signature(_text(_words(100, seed=20)))
+    index.add(sig, {"route": {"notebook": "A", "section": "B"}})
+    index.lookup(sig)["duplicate"] = True
+    assert "duplicate" not in index.lookup(sig)